@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from typing import Dict, FrozenSet, Tuple
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.ttl_cache import cache_get, cache_put
+from models_user_park import UserParkAccess
+from parks import user_allowed_urls
+
+
+# Park access changes rarely (admin grant/revoke), while /data, /write_value
+# and /ws connects ask for it on every call -> short TTL cache per user id.
+ACL_CACHE_TTL = 30.0
+
+_cache: Dict[UUID, Tuple[float, FrozenSet[str]]] = {}
+# Raw UserParkAccess.park_id rows per user, for the admin panel
+_park_ids_cache: Dict[UUID, Tuple[float, Tuple[str, ...]]] = {}
+
+
+async def cached_allowed_urls(
+    session: AsyncSession, user, ttl: float = ACL_CACHE_TTL
+) -> FrozenSet[str]:
+    """
+    Same result as parks.user_allowed_urls, served from memory for up to
+    `ttl` seconds. Returned as a frozenset so callers can't mutate the entry.
+    """
+    urls = cache_get(_cache, user.id)
+    if urls is not None:
+        return urls
+
+    urls = frozenset(await user_allowed_urls(session, user))
+    cache_put(_cache, user.id, urls, ttl)
+    return urls
+
+
+async def cached_park_ids(
+    session: AsyncSession, user_id: UUID, ttl: float = ACL_CACHE_TTL
+) -> Tuple[str, ...]:
+    """
+    The user's assigned park ids as stored (unknown ids included, row
+    order kept), served from memory for up to `ttl` seconds.
+    """
+    ids = cache_get(_park_ids_cache, user_id)
+    if ids is not None:
+        return ids
+
+    ids = tuple((await session.scalars(
+        select(UserParkAccess.park_id).where(UserParkAccess.user_id == user_id)
+    )).all())
+    cache_put(_park_ids_cache, user_id, ids, ttl)
+    return ids
+
+
+def bust(user_id: UUID) -> None:
+    """Forget the cached access for a user (call after changing UserParkAccess)."""
+    _cache.pop(user_id, None)
+    _park_ids_cache.pop(user_id, None)
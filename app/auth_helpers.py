@@ -1,14 +1,17 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import logging
-from typing import Optional
+import time
+from typing import Dict, Optional, Tuple
 from uuid import UUID
 
 import jwt
-from sqlalchemy import select
 
 from app.config import SECRET_KEY
-from db_async import get_async_session
+from app.ttl_cache import cache_get, cache_put
+from db_async import SessionLocal
 from models_user import User as DBUser
 
 
@@ -16,6 +19,31 @@ SECRET = SECRET_KEY
 JWT_ALG = "HS256"
 JWT_AUD = "fastapi-users:auth"
 
+# Short-lived caches keyed by sha256(token), so repeated WS connects with the
+# same token skip the HS256 verification and the users SELECT.
+_JWT_CACHE_TTL = 30.0
+_USER_CACHE_TTL = 60.0
+
+_jwt_cache: Dict[str, Tuple[float, dict]] = {}
+_user_cache: Dict[str, Tuple[float, DBUser]] = {}
+
+# user id -> lookup in progress; concurrent callers share one DB round-trip
+_inflight: Dict[UUID, asyncio.Task] = {}
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def forget_user(user_id: UUID) -> None:
+    """
+    Drop every cached token -> user entry for this user, so the next WS
+    connect re-reads it (call after the user row was updated or deleted).
+    """
+    stale = [k for k, (_, u) in _user_cache.items() if u.id == user_id]
+    for k in stale:
+        _user_cache.pop(k, None)
+
 
 async def get_user_by_id(user_id: str) -> Optional[DBUser]:
     try:
@@ -23,24 +51,58 @@ async def get_user_by_id(user_id: str) -> Optional[DBUser]:
     except Exception:
         return None
 
-    async for session in get_async_session():
-        res = await session.execute(select(DBUser).where(DBUser.id == uuid_id))
-        return res.scalar_one_or_none()
+    task = _inflight.get(uuid_id)
+    if task is None:
+        task = asyncio.ensure_future(_load_user(uuid_id))
+        _inflight[uuid_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(uuid_id, None))
 
+    # shield: one caller going away must not cancel the lookup for the others
+    return await asyncio.shield(task)
+
+
+async def _load_user(uuid_id: UUID) -> Optional[DBUser]:
+    async with SessionLocal() as session:
+        # primary-key lookup: identity map first, cached PK statement otherwise
+        return await session.get(DBUser, uuid_id)
+
+
+def _decode_jwt(token: str, key: Optional[str] = None) -> Optional[dict]:
+    key = key or _token_key(token)
+    payload = cache_get(_jwt_cache, key)
+    if payload is not None:
+        return payload
 
-def _decode_jwt(token: str) -> Optional[dict]:
     try:
-        return jwt.decode(token, SECRET, algorithms=[JWT_ALG], audience=JWT_AUD)
+        payload = jwt.decode(token, SECRET, algorithms=[JWT_ALG], audience=JWT_AUD)
     except Exception as e:
+        # expired / invalid -> make sure nothing cached survives for this token
+        _jwt_cache.pop(key, None)
+        _user_cache.pop(key, None)
         logging.error(f"JWT decode failed: {e}")
         return None
 
+    # never cache past the token's own expiry
+    exp = payload.get("exp")
+    ttl = _JWT_CACHE_TTL if exp is None else min(_JWT_CACHE_TTL, float(exp) - time.time())
+    cache_put(_jwt_cache, key, payload, ttl)
+    return payload
+
 
 async def user_from_token(token: str) -> Optional[DBUser]:
-    payload = _decode_jwt(token)
+    key = _token_key(token)
+    payload = _decode_jwt(token, key)
     if not payload:
         return None
+
+    user = cache_get(_user_cache, key)
+    if user is not None:
+        return user
+
     sub = payload.get("sub")
     if not sub:
         return None
-    return await get_user_by_id(sub)
+    user = await get_user_by_id(sub)
+    if user is not None:
+        cache_put(_user_cache, key, user, _USER_CACHE_TTL)
+    return user
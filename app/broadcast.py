@@ -2,31 +2,65 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime, timedelta
-from typing import Dict, List, Set
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
 
-from fastapi import WebSocket
+from fastapi import WebSocket, status
 
 from app.config import (
     PLC_CONFIG,
     BROADCAST_INTERVAL_SECONDS,
-    PLC_RECONNECT_DELAY_MINUTES,
     COMMON_ROOT_NODE_ID,
 )
 from app.opcua_client import OpcUaClient, ConnectionStatus
-from app.telemetry import payload_from_raw_list
+from app.telemetry import dumps_client_view, telemetry_frame
 
 
 # Global state for OPC UA + WS
-stop_event = threading.Event()
 plc_clients: List[OpcUaClient] = []
-active_ws_connections: Dict[str, Set[WebSocket]] = {}
+_plc_clients_by_url: Dict[str, OpcUaClient] = {}
+# Buckets are created on first connect; unregister_ws pops them again once empty
+active_ws_connections: Dict[str, Set[WebSocket]] = defaultdict(set)
+# allowed_indices -> sockets, kept in step by (un)register_ws so a tick can
+# fan out per group without regrouping or copying the registry
+_ws_groups: Dict[Optional[Tuple[int, ...]], Set[WebSocket]] = defaultdict(set)
 
-# Thread pool used for OPC UA connect/read
-executor = ThreadPoolExecutor(max_workers=max(len(PLC_CONFIG) * 2, 2))
+# Telemetry frames buffered per websocket before the oldest is dropped
+WS_SEND_QUEUE_SIZE = 8
+# A single send taking longer than this means the peer's TCP window is stuck
+# -> the sender closes the socket (this is what evicts clients that stop reading)
+WS_SEND_TIMEOUT_S = 2.0
+
+# Unchanged telemetry isn't re-sent, except this often so idle connections
+# keep seeing traffic (proxies / load balancers drop silent sockets)
+WS_HEARTBEAT_S = 30.0
+
+# Separate pools so a slow (re)connect can never starve the per-tick reads.
+# Reads are network-bound: one thread per PLC (capped), with a small floor
+# so /data snapshots can overlap a broadcast tick.
+read_pool = ThreadPoolExecutor(
+    max_workers=max(4, min(len(PLC_CONFIG), 32)),
+    thread_name_prefix="plc-read",
+)
+reconnect_pool = ThreadPoolExecutor(
+    max_workers=max(len(PLC_CONFIG), 1),
+    thread_name_prefix="plc-reconnect",
+)
+
+# url -> in-flight connect_and_discover future (fire-and-forget)
+_reconnect_futures: Dict[str, Future] = {}
+
+# A tick waits at most this long for PLC reads; a slower PLC keeps its last
+# data for this tick and its read is left to finish (not resubmitted).
+READ_TIMEOUT_S = max(BROADCAST_INTERVAL_SECONDS, 1.0) * 0.8
+
+# url -> read_data future, possibly spanning ticks
+_read_futures: Dict[str, asyncio.Future] = {}
+# url -> last completed read_data result
+_last_data: Dict[str, Dict[str, Any]] = {}
 
 
 def init_plc_clients() -> List[OpcUaClient]:
@@ -34,20 +68,43 @@ def init_plc_clients() -> List[OpcUaClient]:
     Initialize global PLC clients list from PLC_CONFIG.
     Called once at startup.
     """
-    global plc_clients
+    global plc_clients, _plc_clients_by_url
     plc_clients = [
         OpcUaClient(cfg["url"], cfg["name"], COMMON_ROOT_NODE_ID)
         for cfg in PLC_CONFIG
     ]
+    _plc_clients_by_url = {c.url: c for c in plc_clients}
     logging.info(f"Initialized {len(plc_clients)} OPC UA clients")
+
+    # Indices point into plc_clients -> refresh any already-attached sockets
+    _ws_groups.clear()
+    for sockets in active_ws_connections.values():
+        for ws in sockets:
+            ws.allowed_indices = plc_indices_for(getattr(ws, "allowed_urls", None))  # type: ignore[attr-defined]
+            _ws_groups[ws.allowed_indices].add(ws)
     return plc_clients
 
 
-def get_plc_clients() -> List[OpcUaClient]:
+def plc_indices_for(allowed_urls: Optional[FrozenSet[str]]) -> Optional[Tuple[int, ...]]:
     """
-    Accessor so other modules don't rely directly on the global name.
+    Positions in plc_clients (and so in each tick's data list) visible for
+    `allowed_urls`; None means unrestricted.
     """
-    return plc_clients
+    if allowed_urls is None:
+        return None
+    return tuple(i for i, c in enumerate(plc_clients) if c.url in allowed_urls)
+
+
+def get_plc_client(url: str) -> Optional[OpcUaClient]:
+    """O(1) lookup of the client for a PLC URL."""
+    return _plc_clients_by_url.get(url)
+
+
+def get_plc_clients_by_urls(urls: Optional[FrozenSet[str]]) -> List[OpcUaClient]:
+    """Clients whose URL is in `urls` (config order); None means all."""
+    if urls is None:
+        return plc_clients
+    return [c for u, c in _plc_clients_by_url.items() if u in urls]
 
 
 def disconnect_all_clients() -> None:
@@ -62,78 +119,211 @@ def disconnect_all_clients() -> None:
             logging.warning(f"Error disconnecting {cli.name}: {e}")
 
 
-def data_broadcast_loop(loop: asyncio.AbstractEventLoop) -> None:
+def register_ws(user_key: str, ws: WebSocket, allowed_urls: Optional[FrozenSet[str]]) -> None:
+    """
+    Attach the socket's visible parks (None = unrestricted) and add it to the
+    broadcast registry. Must be called on the event loop.
+    """
+    ws.allowed_urls = allowed_urls  # type: ignore[attr-defined]
+    ws.allowed_indices = plc_indices_for(allowed_urls)  # type: ignore[attr-defined]
+    active_ws_connections[user_key].add(ws)
+    _ws_groups[ws.allowed_indices].add(ws)  # type: ignore[attr-defined]
+
+
+def unregister_ws(user_key: str, ws: WebSocket) -> None:
+    bucket = active_ws_connections.get(user_key)
+    if bucket:
+        bucket.discard(ws)
+        if not bucket:
+            active_ws_connections.pop(user_key, None)
+
+    indices = getattr(ws, "allowed_indices", None)
+    group = _ws_groups.get(indices)
+    if group:
+        group.discard(ws)
+        if not group:
+            _ws_groups.pop(indices, None)
+
+
+def update_ws_access(user_key: str, allowed_urls: FrozenSet[str]) -> None:
+    """
+    Re-filter a user's open (restricted) sockets after their park access
+    changed. Must be called on the event loop.
+    """
+    for ws in active_ws_connections.get(user_key, ()):
+        if getattr(ws, "allowed_urls", None) is None:
+            continue  # superuser socket: sees everything regardless
+
+        old = ws.allowed_indices  # type: ignore[attr-defined]
+        group = _ws_groups.get(old)
+        if group:
+            group.discard(ws)
+            if not group:
+                _ws_groups.pop(old, None)
+
+        ws.allowed_urls = allowed_urls  # type: ignore[attr-defined]
+        ws.allowed_indices = plc_indices_for(allowed_urls)  # type: ignore[attr-defined]
+        _ws_groups[ws.allowed_indices].add(ws)  # type: ignore[attr-defined]
+
+
+def start_ws_sender(ws: WebSocket, label: str) -> asyncio.Task:
+    """
+    Give the websocket a bounded send queue plus a consumer task that drains
+    it. Must be called on the event loop; cancel the task on disconnect.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+    ws.send_queue = queue  # type: ignore[attr-defined]
+    return asyncio.create_task(_ws_sender(ws, queue, label))
+
+
+async def _ws_sender(ws: WebSocket, queue: asyncio.Queue, label: str) -> None:
+    while True:
+        text = await queue.get()
+        # Every frame is a full snapshot: if more queued up while the last
+        # send was in flight, only the newest is worth sending.
+        while not queue.empty():
+            text = queue.get_nowait()
+        try:
+            await asyncio.wait_for(ws.send_text(text), timeout=WS_SEND_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            logging.warning(f"WebSocket send to {label} stalled, closing")
+            ws.closing = True  # type: ignore[attr-defined]
+            await _close_slow_ws(ws)
+            return
+        except Exception as e:
+            logging.error(f"WebSocket send error for {label}: {e}")
+            return
+
+
+async def _close_slow_ws(ws: WebSocket) -> None:
+    try:
+        await ws.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except Exception as e:
+        logging.warning(f"Error closing slow WebSocket: {e}")
+
+
+def _enqueue_frames(frames: List[Tuple[WebSocket, str]]) -> None:
+    """
+    Never blocks: a client that lags behind loses its stalest frame so the
+    latest telemetry wins. Stuck clients are closed by their sender task
+    (WS_SEND_TIMEOUT_S), not here.
     """
-    Background thread:
-    - Reconnects dropped PLCs after a delay
-    - Reads all PLC data
+    for ws, text in frames:
+        queue = getattr(ws, "send_queue", None)
+        if queue is None or getattr(ws, "closing", False):
+            continue
+        try:
+            queue.put_nowait(text)
+        except asyncio.QueueFull:
+            queue.get_nowait()
+            queue.put_nowait(text)
+
+
+async def data_broadcast_loop() -> None:
+    """
+    Background asyncio task (started on app startup, cancelled on shutdown):
+    - Reconnects dropped PLCs with jittered exponential backoff
+    - Reads all PLC data (blocking python-opcua calls run on read_pool)
     - Broadcasts telemetry to all active WebSockets
-    - Exits quickly when stop_event is set or the event loop closes
     """
-    reconnect_delay = timedelta(minutes=PLC_RECONNECT_DELAY_MINUTES)
+    loop = asyncio.get_running_loop()
     logging.info("Background broadcast started.")
 
-    while not stop_event.is_set():
-        # If the event loop is already closed, bail out quickly
-        if loop.is_closed():
-            logging.info("Event loop is closed; stopping broadcast thread.")
-            break
+    try:
+        while True:
+            try:
+                await _broadcast_tick(loop)
+                # same 1s floor the old thread loop had; 0 would spin the loop
+                delay = max(BROADCAST_INTERVAL_SECONDS, 1.0)
+            except Exception as e:
+                logging.error(f"Broadcast error: {e}")
+                delay = 5
+            await asyncio.sleep(delay)
+    finally:
+        logging.info("Broadcast stopped.")
 
-        try:
-            # Reconnect any dropped/error clients with backoff
-            reconnect_list = [
-                p
-                for p in plc_clients
-                if p.status in (ConnectionStatus.DISCONNECTED, ConnectionStatus.ERROR)
-                and (
-                    not p.last_reconnect_attempt
-                    or (datetime.now() - p.last_reconnect_attempt) > reconnect_delay
-                )
-            ]
-
-            if reconnect_list:
-                list(executor.map(lambda p: p.connect_and_discover(), reconnect_list))
-
-            # Read all PLC data once per tick
-            all_plc_data = list(executor.map(lambda p: p.read_data(), plc_clients))
-
-            # Broadcast filtered data to each websocket
-            for user_id, sockets in list(active_ws_connections.items()):
-                for ws in list(sockets):
-                    try:
-                        if loop.is_closed():
-                            raise RuntimeError("Event loop closed")
-
-                        allowed = getattr(ws, "allowed_urls", None)
-                        if allowed is None:
-                            visible_raw = all_plc_data
-                        else:
-                            visible_raw = [d for d in all_plc_data if d.get("url") in allowed]
-                            
-                        payload = {
-                            "type": "telemetry_update",
-                            "data": payload_from_raw_list(visible_raw),
-                        }
-
-                        asyncio.run_coroutine_threadsafe(ws.send_json(payload), loop)
-
-                    except RuntimeError as e:
-                        # Happens when trying to submit to a closed loop during shutdown
-                        logging.info(f"Stopping broadcast send loop for {user_id}: {e}")
-                        break
-                    except Exception as e:
-                        logging.error(f"WebSocket send error for {user_id}: {e}")
-
-            # Sleep, but wake early if stop_event is set
-            sleep_secs = int(BROADCAST_INTERVAL_SECONDS) or 1
-            for _ in range(sleep_secs):
-                if stop_event.wait(1):
-                    break
 
-        except Exception as e:
-            logging.error(f"Broadcast error: {e}")
-            # Wait a bit, but allow immediate shutdown via stop_event
-            if stop_event.wait(5):
-                break
+def _collect_read(p: OpcUaClient) -> Dict[str, Any]:
+    fut = _read_futures.get(p.url)
+    if fut is None:
+        return p.status_data()
+
+    if not fut.done():
+        # Still lagging: show what we had, the read keeps running
+        return _last_data.get(p.url) or p.status_data()
+
+    del _read_futures[p.url]
+    try:
+        data = fut.result()
+    except Exception as e:
+        logging.error(f"{p.name}: read failed: {e}")
+        return p.status_data()
+    _last_data[p.url] = data
+    return data
+
+
+async def _broadcast_tick(loop: asyncio.AbstractEventLoop) -> None:
+    # Reconnect any dropped/error clients whose (jittered) backoff expired
+    now = datetime.now()
+    reconnect_list = [
+        p
+        for p in plc_clients
+        if p.status in (ConnectionStatus.DISCONNECTED, ConnectionStatus.ERROR)
+        and p.reconnect_due(now)
+    ]
+
+    # Don't wait for them: reads of healthy PLCs continue this tick
+    for p in reconnect_list:
+        pending = _reconnect_futures.get(p.url)
+        if pending is None or pending.done():
+            _reconnect_futures[p.url] = reconnect_pool.submit(p.connect_and_discover)
+
+    # Read all PLC data once per tick. Only connected PLCs need a pool
+    # thread + OPC UA round-trip; the rest just report their status.
+    for p in plc_clients:
+        if p.status == ConnectionStatus.CONNECTED and p.url not in _read_futures:
+            _read_futures[p.url] = loop.run_in_executor(read_pool, p.read_data)
+
+    # One slow PLC must not hold back every subscriber
+    pending = [f for f in _read_futures.values() if not f.done()]
+    if pending:
+        await asyncio.wait(pending, timeout=READ_TIMEOUT_S)
+
+    all_plc_data = [_collect_read(p) for p in plc_clients]
+
+    # Serialize each PLC's view once per tick; the bytes themselves are
+    # compared with what a socket got last, so unchanged data isn't re-sent
+    # (bar the heartbeat).
+    try:
+        views = [dumps_client_view(d) for d in all_plc_data]
+    except Exception as e:
+        logging.error(f"Telemetry serialization error: {e}")
+        views = []
+
+    # Build one (ws, text) frame per websocket that needs one. Sockets are
+    # already grouped by the PLC indices they may see (None = unrestricted),
+    # so each distinct view is assembled once. Nothing here awaits, so the
+    # registry can't change underneath the loop.
+    frames: List[Tuple[WebSocket, str]] = []
+    now_mono = time.monotonic()
+    for indices, members in _ws_groups.items() if views else ():
+        visible = views if indices is None else [views[i] for i in indices]
+        snapshot = tuple(visible)
+
+        stale = [
+            ws for ws in members
+            if getattr(ws, "last_views", None) != snapshot
+            or now_mono - getattr(ws, "last_sent_at", 0.0) >= WS_HEARTBEAT_S
+        ]
+        if not stale:
+            continue
+
+        text = telemetry_frame(visible)
+        for ws in stale:
+            ws.last_views = snapshot  # type: ignore[attr-defined]
+            ws.last_sent_at = now_mono  # type: ignore[attr-defined]
+            frames.append((ws, text))
 
-    logging.info("Broadcast stopped.")
+    # The per-socket sender tasks do the actual writes
+    if frames:
+        _enqueue_frames(frames)
@@ -22,5 +22,11 @@ TIMEOUT_CONNECT = float(config.get("timeout_connect", 15))
 TIMEOUT_METADATA = float(config.get("timeout_metadata", 2))
 TIMEOUT_DISCOVERY = float(config.get("timeout_discovery", 5))
 
+# Discovered node maps are cached here between reconnects ("" / null disables)
+NODE_CACHE_DIR = config.get("node_cache_dir", str(Path.home() / ".scada_nodecache")) or ""
+NODE_CACHE_TTL_HOURS = float(config.get("node_cache_ttl_hours", 24))
+
 CORS_ALLOW_ORIGINS = os.getenv("CORS_ALLOW_ORIGINS", "")
+# Read back each scalar write before/after and log it (2 extra OPC UA round-trips)
+DEBUG_WRITES = os.getenv("DEBUG_WRITES", "").strip().lower() in ("1", "true", "yes", "on")
 SECRET_KEY = os.getenv("SECRET_KEY") or "change-me"
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.config import NODE_CACHE_DIR, NODE_CACHE_TTL_HOURS
+
+
+def _cache_path(url: str) -> Optional[Path]:
+    if not NODE_CACHE_DIR:
+        return None
+    return Path(NODE_CACHE_DIR) / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+
+def load_node_map(url: str, key: str) -> Optional[Dict[str, str]]:
+    """
+    Return the cached {browse_name: nodeid_string} map for this endpoint, or
+    None if there is no usable entry (missing, expired, other key, symlink).
+    """
+    path = _cache_path(url)
+    if path is None:
+        return None
+
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logging.warning(f"Node cache for {url} not readable: {e}")
+        return None
+
+    try:
+        with os.fdopen(fd, "r", encoding="utf-8") as f:
+            if time.time() - os.fstat(f.fileno()).st_mtime > NODE_CACHE_TTL_HOURS * 3600:
+                return None
+            data = json.load(f)
+    except Exception as e:
+        logging.warning(f"Node cache for {url} is corrupt: {e}")
+        return None
+
+    if data.get("url") != url or data.get("key") != key:
+        return None
+    nodes = data.get("nodes")
+    return nodes if isinstance(nodes, dict) and nodes else None
+
+
+def save_node_map(url: str, key: str, nodes: Dict[str, str]) -> None:
+    """
+    Atomically write the node map (mkstemp + os.replace, mode 0o600).
+    Failures are logged and otherwise ignored; the cache is an optimization.
+    """
+    path = _cache_path(url)
+    if path is None:
+        return
+
+    try:
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if path.parent.is_symlink():
+            logging.warning(f"Refusing symlinked node cache dir {path.parent}")
+            return
+
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"url": url, "key": key, "nodes": nodes}, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except Exception as e:
+        logging.warning(f"Could not write node cache for {url}: {e}")
@@ -1,29 +1,66 @@
 from __future__ import annotations
 
-from datetime import datetime
+from collections import deque
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import concurrent.futures
+import hashlib
 import logging
+import random
 import threading
 
 from opcua import ua, Client
 from opcua.ua.uaerrors import UaStatusCodeError
 
-from app.config import TIMEOUT_CONNECT, TIMEOUT_METADATA, TIMEOUT_DISCOVERY
+from app.config import (
+    TIMEOUT_CONNECT,
+    TIMEOUT_METADATA,
+    TIMEOUT_DISCOVERY,
+    PLC_RECONNECT_DELAY_MINUTES,
+)
+from app.node_cache import load_node_map, save_node_map
 
+# Max nodes per Browse / attributes per Read request during node discovery
+BROWSE_BATCH_SIZE = 1000
+READ_BATCH_SIZE = 1000
 
-def run_with_timeout(func, timeout: float):
+# Reconnect backoff: starts at 1s, doubles per failure, capped at the configured delay
+RECONNECT_BACKOFF_MIN_S = 1.0
+RECONNECT_BACKOFF_MAX_S = max(PLC_RECONNECT_DELAY_MINUTES * 60.0, RECONNECT_BACKOFF_MIN_S)
+
+
+# Workers per PLC for run_with_timeout: a timed-out call keeps its thread
+# until python-opcua gives up, so one spare lets the next attempt start.
+# With both taken by abandoned calls, attempts time out waiting for a worker.
+TIMEOUT_POOL_WORKERS = 2
+
+
+def run_with_timeout(pool: concurrent.futures.ThreadPoolExecutor, func, timeout: float):
     """
-    Run a blocking function in a temporary thread with a hard timeout.
+    Run a blocking function on `pool` with a hard timeout.
     Returns the function result or raises TimeoutError.
+
+    On timeout the underlying OPC UA call keeps running on its worker until it
+    returns; it is abandoned, not interrupted. The timeout only starts once
+    the call is running, so time spent queued behind such an abandoned call
+    doesn't count against it; waiting for a free worker is itself bounded by
+    `timeout`, so a pool full of abandoned calls fails fast instead of hanging.
     """
-    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as exe:
-        future = exe.submit(func)
-        try:
-            return future.result(timeout=timeout)
-        except concurrent.futures.TimeoutError:
-            raise TimeoutError(f"Operation timed out after {timeout} seconds")
+    started = threading.Event()
+
+    def run():
+        started.set()
+        return func()
+
+    future = pool.submit(run)
+    # cancel() only fails if the call started in the meantime -> wait for it
+    if not started.wait(timeout) and future.cancel():
+        raise TimeoutError(f"No free worker within {timeout} seconds")
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        raise TimeoutError(f"Operation timed out after {timeout} seconds")
 
 
 class ConnectionStatus(str, Enum):
@@ -50,17 +87,52 @@ class OpcUaClient:
 
         self.client: Optional[Client] = None
         self.nodes: Dict[str, Any] = {}
+        # Snapshot of self.nodes for read_data; only changes on (re)connect
+        self._cached_names: Tuple[str, ...] = ()
+        self._cached_ids: Tuple[ua.NodeId, ...] = ()
+        # CMD_Instant_Cutoff bit index -> child node, resolved on first write
+        self._cutoff_children: Optional[Dict[int, Any]] = None
+        # browse name -> VariantType used when writing; filled after discovery
+        self.node_variant_types: Dict[str, ua.VariantType] = {}
 
         self.status = ConnectionStatus.DISCONNECTED
         self.last_reconnect_attempt: Optional[datetime] = None
+        self.next_reconnect_at: Optional[datetime] = None
+        self._backoff_s = RECONNECT_BACKOFF_MIN_S
 
         # Prevent read/write/connect colliding on the same underlying socket.
         self._lock = threading.RLock()
 
+        # Own pool for the timeout-guarded connect/discovery calls, so calls
+        # abandoned on one dead PLC can't starve the others
+        self._timeout_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=TIMEOUT_POOL_WORKERS,
+            thread_name_prefix="opcua-to",
+        )
+
     @property
     def lock(self) -> threading.RLock:
         return self._lock
 
+    # ----------------------------------------
+    # RECONNECT SCHEDULING
+    # ----------------------------------------
+    def reconnect_due(self, now: datetime) -> bool:
+        return self.next_reconnect_at is None or now >= self.next_reconnect_at
+
+    def _schedule_reconnect(self) -> None:
+        """
+        Full jitter: wait uniform(0, backoff), so PLCs that dropped together
+        (network flap) don't all reconnect on the same tick.
+        """
+        self.next_reconnect_at = datetime.now() + timedelta(
+            seconds=random.uniform(0, self._backoff_s)
+        )
+
+    def _connect_failed(self) -> None:
+        self._schedule_reconnect()
+        self._backoff_s = min(self._backoff_s * 2, RECONNECT_BACKOFF_MAX_S)
+
     # ----------------------------------------
     # SAFE DISCONNECT (fast shutdown)
     # ----------------------------------------
@@ -91,33 +163,180 @@ class OpcUaClient:
     # ----------------------------------------
     # NODE DISCOVERY
     # ----------------------------------------
-    def _get_readable_nodes(self, node) -> Dict[str, Any]:
+    def _read_attributes(self, client: Client, to_read: List[Tuple[ua.NodeId, int]]) -> List[ua.DataValue]:
+        """
+        Read many (node, attribute) pairs with as few Read requests as
+        possible (READ_BATCH_SIZE per request). Results keep input order.
+        """
+        uaclient = client.uaclient
+        out: List[ua.DataValue] = []
+        for start in range(0, len(to_read), READ_BATCH_SIZE):
+            params = ua.ReadParameters()
+            for nid, attr in to_read[start:start + READ_BATCH_SIZE]:
+                rv = ua.ReadValueId()
+                rv.NodeId = nid
+                rv.AttributeId = attr
+                params.NodesToRead.append(rv)
+            out.extend(uaclient.read(params))
+        return out
+
+    def _browse_batch(self, client: Client, nodeids: List[ua.NodeId]) -> List[List[ua.ReferenceDescription]]:
+        """
+        One Browse request for many nodes: hierarchical forward references to
+        Objects/Variables, returning BrowseName + NodeClass with each reference
+        so no per-child attribute reads are needed.
+        """
+        params = ua.BrowseParameters()
+        params.View.Timestamp = ua.get_win_epoch()
+        params.RequestedMaxReferencesPerNode = 0
+        for nid in nodeids:
+            desc = ua.BrowseDescription()
+            desc.NodeId = nid
+            desc.BrowseDirection = ua.BrowseDirection.Forward
+            desc.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+            desc.IncludeSubtypes = True
+            desc.NodeClassMask = ua.NodeClass.Object | ua.NodeClass.Variable
+            desc.ResultMask = ua.BrowseResultMask.BrowseName | ua.BrowseResultMask.NodeClass
+            params.NodesToBrowse.append(desc)
+
+        uaclient = client.uaclient
+        out: List[List[ua.ReferenceDescription]] = []
+        for res in uaclient.browse(params):
+            if not res.StatusCode.is_good():
+                out.append([])
+                continue
+            refs = list(res.References)
+            cp = res.ContinuationPoint
+            while cp:
+                more = ua.BrowseNextParameters()
+                more.ContinuationPoints = [cp]
+                more.ReleaseContinuationPoints = False
+                nxt = uaclient.browse_next(more)[0]
+                refs.extend(nxt.References)
+                cp = nxt.ContinuationPoint
+            out.append(refs)
+        return out
+
+    def _get_readable_nodes(self, client: Client, root) -> Dict[str, Any]:
+        """
+        Breadth-first walk below `root`, browsing up to BROWSE_BATCH_SIZE
+        nodes per OPC UA request. Every Variable found is readable; Objects and
+        Variables are both descended into (array elements live under their
+        Variable parent).
+        """
         nodes_dict: Dict[str, Any] = {}
 
         try:
-            if node.get_node_class() == ua.NodeClass.Variable:
-                nodes_dict[node.get_browse_name().Name] = node
-        except Exception:
-            pass
-
-        try:
-            for child in node.get_children():
-                nodes_dict.update(self._get_readable_nodes(child))
-        except Exception:
-            pass
+            node_class, browse_name = self._read_attributes(client, [
+                (root.nodeid, ua.AttributeIds.NodeClass),
+                (root.nodeid, ua.AttributeIds.BrowseName),
+            ])
+            if node_class.Value.Value == ua.NodeClass.Variable:
+                nodes_dict[browse_name.Value.Value.Name] = root
+        except Exception as e:
+            # not fatal: the browse below still finds everything under root
+            logging.warning(f"{self.name}: Could not read root node attributes: {e}")
+
+        queue = deque([root.nodeid])
+        seen = {root.nodeid}
+        while queue:
+            batch = [queue.popleft() for _ in range(min(len(queue), BROWSE_BATCH_SIZE))]
+            try:
+                results = self._browse_batch(client, batch)
+            except Exception as e:
+                logging.warning(f"{self.name}: Browse of {len(batch)} nodes failed: {e}")
+                continue
+
+            for refs in results:
+                for ref in refs:
+                    nid = ref.NodeId
+                    if nid in seen:
+                        continue
+                    seen.add(nid)
+                    if ref.NodeClass == ua.NodeClass.Variable:
+                        nodes_dict[ref.BrowseName.Name] = client.get_node(nid)
+                    queue.append(nid)
 
         return nodes_dict
 
-    def _discover_nodes(self) -> Dict[str, Any]:
-        root = self.client.get_node(self.root_node_id)  # type: ignore[union-attr]
-        return self._get_readable_nodes(root)
+    def _discover_nodes(self, client: Client) -> Dict[str, Any]:
+        root = client.get_node(self.root_node_id)
+        return self._get_readable_nodes(client, root)
+
+    def _node_cache_key(self, client: Client) -> str:
+        """
+        Identify the address space a cached node map belongs to: root node +
+        server BuildInfo (ns=0;i=2260) + a fingerprint of the root's direct
+        children. BuildInfo describes the firmware and usually survives a PLC
+        program download; the one-level browse is what notices tags/blocks
+        added or removed under the root. Empty if either can't be read.
+        """
+        try:
+            info = client.get_node("ns=0;i=2260").get_value()
+            root = client.get_node(self.root_node_id)
+            children = sorted(
+                f"{ref.NodeId.to_string()}={ref.BrowseName.to_string()}"
+                for ref in self._browse_batch(client, [root.nodeid])[0]
+            )
+        except Exception:
+            return ""
+        fingerprint = hashlib.sha256("\n".join(children).encode()).hexdigest()[:16]
+        return (
+            f"{self.root_node_id}|{info.SoftwareVersion}|{info.BuildNumber}"
+            f"|{info.BuildDate}|{len(children)}:{fingerprint}"
+        )
+
+    def _cached_nodes_valid(self, client: Client, nodes: Dict[str, Any]) -> bool:
+        # Batched NodeClass read for all cached ids: catches removed/renamed nodes.
+        results = self._read_attributes(
+            client,
+            [(n.nodeid, ua.AttributeIds.NodeClass) for n in nodes.values()]
+        )
+        return all(
+            dv.StatusCode.is_good() and dv.Value.Value == ua.NodeClass.Variable
+            for dv in results
+        )
+
+    def _load_or_discover_nodes(self, client: Client) -> Dict[str, Any]:
+        key = self._node_cache_key(client)
+        if key:
+            cached = load_node_map(self.url, key)
+            if cached:
+                nodes = {name: client.get_node(nid) for name, nid in cached.items()}
+                if self._cached_nodes_valid(client, nodes):
+                    logging.info(f"{self.name}: 📦 Node map loaded from cache")
+                    return nodes
+
+        nodes = self._discover_nodes(client)
+        if key and nodes:
+            save_node_map(self.url, key, {name: n.nodeid.to_string() for name, n in nodes.items()})
+        return nodes
+
+    def _read_variant_types(self, client: Client, nodes: Dict[str, Any]) -> Dict[str, ua.VariantType]:
+        """
+        One batched DataType read for all nodes. Built-in types (ns=0, i<=21)
+        map straight onto VariantType; subtypes/enums/structures are left out
+        and resolved per node on first write instead.
+        """
+        names = list(nodes.keys())
+        results = self._read_attributes(
+            client, [(nodes[n].nodeid, ua.AttributeIds.DataType) for n in names]
+        )
+        out: Dict[str, ua.VariantType] = {}
+        for name, dv in zip(names, results):
+            dt = dv.Value.Value if dv.StatusCode.is_good() else None
+            if (
+                isinstance(dt, ua.NodeId)
+                and dt.NamespaceIndex == 0
+                and isinstance(dt.Identifier, int)
+                and 1 <= dt.Identifier <= 21
+            ):
+                out[name] = ua.VariantType(dt.Identifier)
+        return out
 
     # ----------------------------------------
     # CONNECT + DISCOVER (timeouts protected)
     # ----------------------------------------
-    def _perform_connect(self) -> None:
-        self.client.connect()  # type: ignore[union-attr]
-
     def connect_and_discover(self) -> bool:
         with self._lock:
             self.last_reconnect_attempt = datetime.now()
@@ -129,39 +348,63 @@ class OpcUaClient:
                 except Exception:
                     pass
 
-            self.client = Client(self.url, timeout=40)
+            # Fresh client per attempt, and the calls below only get this one:
+            # work abandoned on timeout never touches a later attempt's client
+            client = Client(self.url, timeout=40)
+            self.client = client
             self.status = ConnectionStatus.CONNECTING
             self.nodes = {}
+            self._cached_names = ()
+            self._cached_ids = ()
+            self._cutoff_children = None
+            self.node_variant_types = {}
 
             logging.info(f"{self.name}: 🔄 Connecting to {self.url} ...")
 
             try:
                 # CONNECT TIMEOUT
-                run_with_timeout(self._perform_connect, TIMEOUT_CONNECT)
+                run_with_timeout(self._timeout_pool, client.connect, TIMEOUT_CONNECT)
 
                 # METADATA TIMEOUT (optional)
                 def read_metadata():
                     try:
-                        return self.client.get_node("ns=0;i=2254").get_value()
+                        return client.get_node("ns=0;i=2254").get_value()
                     except Exception:
                         return ""
 
                 try:
-                    self.server_name = run_with_timeout(read_metadata, TIMEOUT_METADATA) or ""
+                    self.server_name = run_with_timeout(self._timeout_pool, read_metadata, TIMEOUT_METADATA) or ""
                 except TimeoutError:
                     logging.warning(f"{self.name}: ⏳ Metadata read timed out")
                     self.server_name = ""
 
                 # DISCOVERY TIMEOUT
                 try:
-                    self.nodes = run_with_timeout(self._discover_nodes, TIMEOUT_DISCOVERY)
+                    self.nodes = run_with_timeout(
+                        self._timeout_pool, lambda: self._load_or_discover_nodes(client), TIMEOUT_DISCOVERY
+                    )
                 except TimeoutError:
                     logging.error(f"{self.name}: ⏳ Node discovery timed out")
                     self.status = ConnectionStatus.ERROR
+                    self._connect_failed()
                     return False
 
+                # Write metadata is best-effort: writes fall back to a lazy lookup
+                try:
+                    nodes = self.nodes
+                    self.node_variant_types = run_with_timeout(
+                        self._timeout_pool, lambda: self._read_variant_types(client, nodes), TIMEOUT_METADATA
+                    )
+                except Exception as e:
+                    logging.warning(f"{self.name}: ⚠️ Could not read node data types: {e}")
+
+                self._cached_names = tuple(self.nodes.keys())
+                # raw NodeIds: read_data talks to uaclient without Node wrappers
+                self._cached_ids = tuple(n.nodeid for n in self.nodes.values())
                 logging.info(f"{self.name}: 🔁 Node map built ({len(self.nodes)} nodes).")
                 self.status = ConnectionStatus.CONNECTED
+                self._backoff_s = RECONNECT_BACKOFF_MIN_S
+                self.next_reconnect_at = None
                 logging.info(f"{self.name}: ✅ CONNECTED")
                 return True
 
@@ -169,43 +412,53 @@ class OpcUaClient:
                 logging.error(f"{self.name}: ⏳ Connection timeout: {e}")
                 self.status = ConnectionStatus.DISCONNECTED
                 self.client = None
+                self._connect_failed()
                 return False
 
             except Exception as e:
                 logging.error(f"{self.name}: ❌ Connection error: {e}")
                 self.status = ConnectionStatus.DISCONNECTED
                 self.client = None
+                self._connect_failed()
                 return False
 
     # ----------------------------------------
     # READ DATA
     # ----------------------------------------
+    def status_data(self) -> Dict[str, Any]:
+        """
+        Telemetry dict without node values. Needs no lock and no I/O, so the
+        broadcast loop uses it for PLCs that are not connected.
+        """
+        return {
+            "name": self.name,
+            "status": self.status.value,
+            "url": self.url,
+            "nodes": {},
+        }
+
     def read_data(self) -> Dict[str, Any]:
         with self._lock:
-            data = {
-                "name": self.name,
-                "status": self.status.value,
-                "url": self.url,
-                "nodes": {},
-            }
+            data = self.status_data()
 
             if self.status != ConnectionStatus.CONNECTED or not self.client:
                 return data
 
             try:
-                ids = list(self.nodes.values())
-                names = list(self.nodes.keys())
-
-                if not ids:
+                if not self._cached_ids:
                     data["error"] = "No readable nodes."
                     return data
 
-                values = self.client.get_values(ids)
-                for n, v in zip(names, values):
-                    data["nodes"][n] = v
+                results = self.client.uaclient.get_attributes(
+                    self._cached_ids, ua.AttributeIds.Value
+                )
+                data["nodes"] = dict(
+                    zip(self._cached_names, (dv.Value.Value for dv in results))
+                )
 
             except UaStatusCodeError as e:
                 self.status = ConnectionStatus.ERROR
+                self._schedule_reconnect()
                 data["error"] = f"OPC UA read error: {e}"
             except Exception:
                 data["error"] = "Temporary read failure."
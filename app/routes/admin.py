@@ -1,6 +1,7 @@
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -27,7 +28,15 @@ async def list_users(
     _: DBUser = Depends(current_superuser),
     session: AsyncSession = Depends(get_async_session),
 ):
-    stmt = select(DBUser)
+    # Only the summary columns: rows come back as plain tuples, no ORM objects
+    stmt = select(
+        DBUser.id,
+        DBUser.email,
+        DBUser.is_superuser,
+        DBUser.is_active,
+        DBUser.organization_id,
+        DBUser.default_park_id,
+    )
     if q:
         like = f"%{q}%"
         stmt = stmt.where(func.lower(DBUser.email).like(func.lower(like)))
@@ -37,17 +46,22 @@ async def list_users(
         stmt = stmt.where(DBUser.is_active == is_active)
     stmt = stmt.order_by(DBUser.email).limit(limit).offset(offset)
 
-    result = await session.execute(stmt)
-    users = result.scalars().all()
-
-    return [
-        AdminUserSummary(
-            id=u.id,
-            email=u.email,
-            is_superuser=bool(u.is_superuser),
-            is_active=bool(u.is_active),
-            organization_id=u.organization_id,
-            default_park_id=u.default_park_id,
-        )
-        for u in users
-    ]
+    # Server-side cursor: rows are built as they arrive, no buffered result list.
+    # Values come straight from typed DB columns, so the rows go out as plain
+    # dicts through orjson; response_model only documents the shape.
+    result = await session.stream(stmt)
+    # close the cursor even if building the rows fails halfway
+    try:
+        return ORJSONResponse([
+            {
+                "id": str(r[0]),
+                "email": r[1],
+                "is_superuser": bool(r[2]),
+                "is_active": bool(r[3]),
+                "organization_id": r[4],
+                "default_park_id": r[5],
+            }
+            async for r in result
+        ])
+    finally:
+        await result.close()
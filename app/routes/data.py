@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Depends
+import asyncio
+
+from fastapi import APIRouter, Depends, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth import current_user
 from db_async import get_async_session
 from models_user import User as DBUser
-from parks import PARKS, user_allowed_urls
-from app.broadcast import get_plc_clients, executor
-from app.telemetry import payload_from_raw_list
+from parks import all_park_urls
+from app.acl_cache import cached_allowed_urls
+from app.broadcast import get_plc_clients_by_urls, read_pool
+from app.telemetry import TelemetryResponse, payload_from_raw_list
+
+router = APIRouter(tags=["data"], default_response_class=TelemetryResponse)
 
-router = APIRouter(tags=["data"])
+# Body for users who can't see any park; nothing to read or serialize
+_EMPTY_BODY = b'{"plc_clients":[]}'
 
 
 @router.get("/data")
@@ -19,20 +25,23 @@ async def get_initial_data(
     """
     Return the initial telemetry snapshot for all parks the user is allowed to see.
     - Superuser: all parks from PARKS
-    - Normal user: only parks assigned in UserParkAccess (via parks.user_allowed_urls)
+    - Normal user: only parks assigned in UserParkAccess (via app.acl_cache)
     """
     if user.is_superuser:
         # Superuser sees every park defined in config.json / PARKS
-        allowed_urls = {info["url"] for info in PARKS.values()}
+        allowed_urls = all_park_urls()
     else:
         # Normal user: map DB park_ids -> URLs using shared helper
-        allowed_urls = await user_allowed_urls(session, user)
+        allowed_urls = await cached_allowed_urls(session, user)
 
-    clients = get_plc_clients()
-    if allowed_urls is None:
-        visible_clients = clients
-    else:
-        visible_clients = [p for p in clients if p.url in allowed_urls]
+    visible_clients = get_plc_clients_by_urls(allowed_urls)
+    if not visible_clients:
+        return Response(_EMPTY_BODY, media_type="application/json")
 
-    raw = list(executor.map(lambda p: p.read_data(), visible_clients))
-    return payload_from_raw_list(raw)
+    # Reads run concurrently on the pool; the event loop stays free meanwhile
+    loop = asyncio.get_running_loop()
+    raw = await asyncio.gather(
+        *(loop.run_in_executor(read_pool, p.read_data) for p in visible_clients)
+    )
+    # Returned as a Response so FastAPI skips jsonable_encoder; orjson does it all
+    return TelemetryResponse(payload_from_raw_list(raw))
@@ -1,5 +1,6 @@
-from typing import Any
+from typing import Any, Dict, Set, Tuple
 
+import asyncio
 import logging
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,13 +9,112 @@ from opcua import ua
 from auth import current_user
 from db_async import get_async_session
 from models_user import User as DBUser
-from parks import PARKS, user_allowed_urls
-from app.broadcast import get_plc_clients
+from parks import all_park_urls
+from app.acl_cache import cached_allowed_urls
+from app.broadcast import get_plc_client
+from app.config import DEBUG_WRITES
 from app.opcua_client import ConnectionStatus
 from app.schemas import WriteRequest
 
 router = APIRouter(tags=["write"])
 
+# Variant types whose values get coerced with int() / float() before writing
+_INT_VTS = frozenset({
+    ua.VariantType.Int16,
+    ua.VariantType.Int32,
+    ua.VariantType.Int64,
+    ua.VariantType.UInt16,
+    ua.VariantType.UInt32,
+    ua.VariantType.UInt64,
+})
+_FLOAT_VTS = frozenset({ua.VariantType.Float, ua.VariantType.Double})
+
+# Scalar writes to the same node within this window collapse into one
+WRITE_DEBOUNCE_S = 0.05
+
+
+class _PendingWrite:
+    __slots__ = ("value", "user_email", "future")
+
+    def __init__(self, future: asyncio.Future):
+        self.value: Any = None
+        self.user_email = ""
+        self.future = future
+
+
+# (plc_url, node_name) -> write waiting for its debounce window to close
+_pending_writes: Dict[Tuple[str, str], _PendingWrite] = {}
+# Strong refs for the flush tasks (the loop only keeps weak ones)
+_flush_tasks: Set[asyncio.Task] = set()
+
+
+def _resolve_cutoff_children(parent) -> dict[int, Any]:
+    """Map the '[i]' children of CMD_Instant_Cutoff to their bit index."""
+    index_map: dict[int, Any] = {}
+    for child in parent.get_children():
+        try:
+            bn = child.get_browse_name().Name
+            if bn.startswith("[") and bn.endswith("]"):
+                idx = int(bn[1:-1])
+                index_map[idx] = child
+        except Exception:
+            continue
+    return index_map
+
+
+def _write_cutoff(target, parent, values: list) -> bool:
+    """
+    Write the CMD_Instant_Cutoff bits (blocking). True if they went out in
+    one batched Write, False if the per-bit fallback was used.
+    """
+    # 🔒 LOCK START
+    with target.lock:
+        # Children never change within a session -> browse them only once
+        # (the cache is reset on reconnect)
+        index_map = target._cutoff_children
+        if index_map is None:
+            try:
+                index_map = _resolve_cutoff_children(parent)
+            except Exception as e:
+                logging.error(f"Failed to get children for CMD_Instant_Cutoff: {e}")
+                raise HTTPException(500, "Failed to resolve cutoff child nodes.")
+            if index_map:
+                target._cutoff_children = index_map
+
+        if not index_map:
+            logging.error("No [index] children found under CMD_Instant_Cutoff.")
+            raise HTTPException(404, "Cutoff child bits not found.")
+
+        # Check every bit exists before writing any of them
+        bits = []
+        for idx, bit in enumerate(values):
+            child = index_map.get(idx)
+            if child is None:
+                logging.error(f"Child index [{idx}] not found under CMD_Instant_Cutoff.")
+                raise HTTPException(404, f"Cutoff bit [{idx}] not found.")
+            dv = ua.DataValue(ua.Variant(bool(bit), ua.VariantType.Boolean))
+            bits.append((idx, bit, child, dv))
+
+        # All bits in one Write service call ...
+        try:
+            target.client.set_values(
+                [child for _, _, child, _ in bits], [dv for _, _, _, dv in bits]
+            )
+            batched = True
+        except Exception as e:
+            logging.warning(f"Batched cutoff write failed, retrying per bit: {e}")
+            batched = False
+
+        # ... or, if the server rejects that, one request per bit as before
+        for idx, bit, child, dv in bits if not batched else ():
+            try:
+                child.set_attribute(ua.AttributeIds.Value, dv)
+            except Exception as e:
+                logging.error(f"Write failed on CMD_Instant_Cutoff[{idx}]: {e}")
+                raise HTTPException(500, f"Write failed on cutoff bit [{idx}]: {e}")
+    # 🔓 LOCK END
+    return batched
+
 
 @router.post("/write_value")
 async def write_plc_value(
@@ -35,19 +135,20 @@ async def write_plc_value(
     # ------------------------------------------------------------------
     # 1) PERMISSIONS: superuser OR user with access to this park
     # ------------------------------------------------------------------
-    if user.is_superuser:
-        allowed_urls = {info["url"] for info in PARKS.values()}
-    else:
-        allowed_urls = await user_allowed_urls(session, user)
+    # A URL that isn't configured at all can't be allowed for anyone:
+    # reject it before touching the DB.
+    if req.plc_url not in all_park_urls():
+        raise HTTPException(404, "Unknown park.")
 
-    if req.plc_url not in allowed_urls:
-        raise HTTPException(403, "You do not have write access to this park.")
+    if not user.is_superuser:
+        allowed_urls = await cached_allowed_urls(session, user)
+        if req.plc_url not in allowed_urls:
+            raise HTTPException(403, "You do not have write access to this park.")
 
     # ------------------------------------------------------------------
     # 2) Resolve target PLC client
     # ------------------------------------------------------------------
-    clients = get_plc_clients()
-    target = next((p for p in clients if p.url == req.plc_url), None)
+    target = get_plc_client(req.plc_url)
     if not target or target.status != ConnectionStatus.CONNECTED:
         raise HTTPException(404, "PLC not connected.")
 # ------------------------------------------------------------------
@@ -64,45 +165,18 @@ async def write_plc_value(
             logging.error("Array parent node 'CMD_Instant_Cutoff' not found.")
             raise HTTPException(404, "Array node 'CMD_Instant_Cutoff' not found.")
 
-        # 🔒 LOCK START
-        with target.lock:
-            try:
-                children = parent.get_children()
-            except Exception as e:
-                logging.error(f"Failed to get children for CMD_Instant_Cutoff: {e}")
-                raise HTTPException(500, "Failed to resolve cutoff child nodes.")
-
-            index_map: dict[int, Any] = {}
-            for child in children:
-                try:
-                    bn = child.get_browse_name().Name
-                    if bn.startswith("[") and bn.endswith("]"):
-                        idx = int(bn[1:-1])
-                        index_map[idx] = child
-                except Exception:
-                    continue
-
-            if not index_map:
-                logging.error("No [index] children found under CMD_Instant_Cutoff.")
-                raise HTTPException(404, "Cutoff child bits not found.")
+        # Blocking OPC UA calls under the PLC lock: run them off the event
+        # loop, or one slow PLC stalls every websocket and route meanwhile
+        batched = await asyncio.get_running_loop().run_in_executor(
+            None, _write_cutoff, target, parent, req.value
+        )
 
+        # Log after releasing the lock; handlers may block (file / network)
+        if batched:
+            logging.info("Write %s to 'CMD_Instant_Cutoff' on %s", list(req.value), target.name)
+        else:
             for idx, bit in enumerate(req.value):
-                child = index_map.get(idx)
-                if child is None:
-                    logging.error(f"Child index [{idx}] not found under CMD_Instant_Cutoff.")
-                    raise HTTPException(404, f"Cutoff bit [{idx}] not found.")
-
-                try:
-                    dv = ua.DataValue(ua.Variant(bool(bit), ua.VariantType.Boolean))
-                    child.set_attribute(ua.AttributeIds.Value, dv)
-                    logging.info(
-                        f"Write {bit} to 'CMD_Instant_Cutoff[{idx}]' on {target.name}"
-                    )
-                except Exception as e:
-                    logging.error(f"Write failed on CMD_Instant_Cutoff[{idx}]: {e}")
-                    raise HTTPException(500, f"Write failed on cutoff bit [{idx}]: {e}")
-
-        # 🔓 LOCK END
+                logging.info("Write %s to 'CMD_Instant_Cutoff[%d]' on %s", bit, idx, target.name)
         return {"status": "success", "written": req.value}
     
     # For any other list value we don't support array writes yet
@@ -120,54 +194,130 @@ async def write_plc_value(
     if not node:
         raise HTTPException(404, f"Node '{req.node_name}' not found.")
 
+    # Slider drags send many writes per node: coalesce them so only the
+    # latest value in a short window reaches the PLC
+    return await _debounced_write(req, user.email)
+
+
+async def _debounced_write(req: WriteRequest, user_email: str) -> dict:
+    """
+    The first write for a node opens a WRITE_DEBOUNCE_S window; writes that
+    arrive meanwhile only replace the value. Every caller in the window gets
+    the outcome of the single write that is then sent.
+    """
+    key = (req.plc_url, req.node_name)
+    pending = _pending_writes.get(key)
+    if pending is None:
+        future = asyncio.get_running_loop().create_future()
+        # Every waiter may have gone away by the time the write fails
+        future.add_done_callback(_retrieve_exception)
+        pending = _PendingWrite(future)
+        _pending_writes[key] = pending
+        task = asyncio.create_task(_flush_write(key))
+        _flush_tasks.add(task)
+        task.add_done_callback(_flush_tasks.discard)
+
+    pending.value = req.value
+    pending.user_email = user_email
+
+    # shield: one caller going away must not cancel the write for the others
+    return await asyncio.shield(pending.future)
+
+
+def _retrieve_exception(future: asyncio.Future) -> None:
+    # Keeps asyncio from logging "Future exception was never retrieved";
+    # the failure itself is already logged by _write_scalar.
+    if not future.cancelled():
+        future.exception()
+
+
+async def _flush_write(key: Tuple[str, str]) -> None:
+    try:
+        await asyncio.sleep(WRITE_DEBOUNCE_S)
+    except asyncio.CancelledError:
+        # shutdown: release the waiters instead of leaving them hanging
+        _pending_writes.pop(key).future.cancel()
+        raise
+
+    pending = _pending_writes.pop(key)
+    plc_url, node_name = key
+    try:
+        # Resolve again: the PLC may have reconnected (new client / node
+        # objects) during the debounce window
+        target = get_plc_client(plc_url)
+        if not target or target.status != ConnectionStatus.CONNECTED:
+            raise HTTPException(404, "PLC not connected.")
+        node = target.nodes.get(node_name)
+        if not node:
+            raise HTTPException(404, f"Node '{node_name}' not found.")
+
+        # blocking (lock + round-trips): keep it off the event loop
+        result = await asyncio.get_running_loop().run_in_executor(
+            None, _write_scalar, target, node, node_name, plc_url, pending.value, pending.user_email
+        )
+    except asyncio.CancelledError:
+        pending.future.cancel()
+        raise
+    except Exception as e:
+        pending.future.set_exception(e)
+    else:
+        pending.future.set_result(result)
+
+
+def _write_scalar(target, node, node_name: str, plc_url: str, value: Any, user_email: str) -> dict:
+    """Coerce `value` to the node's variant type and write it (blocking)."""
+    # Variant types are read in bulk at discovery; only a miss costs a round-trip
+    vt = target.node_variant_types.get(node_name)
+
     # 🔒 LOCK START
     with target.lock:
         try:
-            vt = node.get_data_type_as_variant_type()
-            v: Any = req.value
+            if vt is None:
+                vt = node.get_data_type_as_variant_type()
+                target.node_variant_types[node_name] = vt
+            v: Any = value
 
             if vt == ua.VariantType.Boolean:
                 v = bool(v)
-            elif vt in (
-                ua.VariantType.Int16,
-                ua.VariantType.Int32,
-                ua.VariantType.Int64,
-                ua.VariantType.UInt16,
-                ua.VariantType.UInt32,
-                ua.VariantType.UInt64,
-            ):
+            elif vt in _INT_VTS:
                 v = int(v)
-            elif vt in (ua.VariantType.Float, ua.VariantType.Double):
+            elif vt in _FLOAT_VTS:
                 v = float(v)
 
-            try:
-                before = node.get_value()
-                logging.info(
-                    f"[WRITE DEBUG] Before write '{req.node_name}' on {target.name}: "
-                    f"{before!r} (type={type(before).__name__}, vt={vt})"
-                )
-            except Exception:
-                pass
+            # The before/after reads are extra round-trips under the lock:
+            # only pay for them when asked to (DEBUG_WRITES or DEBUG logging).
+            debug = DEBUG_WRITES or logging.getLogger().isEnabledFor(logging.DEBUG)
+
+            if debug:
+                try:
+                    before = node.get_value()
+                    logging.info(
+                        "[WRITE DEBUG] Before write '%s' on %s: %r (type=%s, vt=%s)",
+                        node_name, target.name, before, type(before).__name__, vt,
+                    )
+                except Exception:
+                    pass
 
             dv = ua.DataValue(ua.Variant(v, vt))
             node.set_attribute(ua.AttributeIds.Value, dv)
-            logging.info(
-                f"USER={user.email} WRITE {v} -> {req.node_name} "
-                f"ON {target.name} ({req.plc_url})"
-            )
-
-            try:
-                after = node.get_value()
-                logging.info(
-                    f"[WRITE DEBUG] After write '{req.node_name}' on {target.name}: "
-                    f"{after!r} (type={type(after).__name__})"
-                )
-            except Exception:
-                pass
 
-            return {"status": "success"}
+            if debug:
+                try:
+                    after = node.get_value()
+                    logging.info(
+                        "[WRITE DEBUG] After write '%s' on %s: %r (type=%s)",
+                        node_name, target.name, after, type(after).__name__,
+                    )
+                except Exception:
+                    pass
 
         except Exception as e:
             logging.error(f"Write failed: {e}")
             raise HTTPException(500, "Write failed.")
     # 🔓 LOCK END
+
+    logging.info(
+        "USER=%s WRITE %s -> %s ON %s (%s)",
+        user_email, v, node_name, target.name, plc_url,
+    )
+    return {"status": "success"}
@@ -3,10 +3,11 @@ import logging
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
 
-from db_async import get_async_session
-from parks import PARKS, user_allowed_urls
+from db_async import SessionLocal
+from parks import PARKS
+from app.acl_cache import cached_allowed_urls
 from app.auth_helpers import user_from_token
-from app.broadcast import active_ws_connections
+from app.broadcast import register_ws, start_ws_sender, unregister_ws
 
 router = APIRouter()
 
@@ -47,44 +48,35 @@ async def ws_endpoint(websocket: WebSocket):
     # -----------------------------
     # Determine allowed parks/URLs
     # -----------------------------
-    async for session in get_async_session():
-        if user.is_superuser:
-            allowed_urls = None  # unrestricted
-        else:
-            allowed_urls = await user_allowed_urls(session, user)
+    if user.is_superuser:
+        allowed_urls = None  # unrestricted
+    else:
+        async with SessionLocal() as session:
+            allowed_urls = await cached_allowed_urls(session, user)
 
-    # Attach allowed URLs to the websocket so the broadcast thread can filter
-    websocket.allowed_urls = allowed_urls  # type: ignore[attr-defined]
+    # Bounded outgoing queue; the broadcast task only ever enqueues
+    sender = start_ws_sender(websocket, user.email)
 
-    # Track this connection in the global map
+    # Track this connection; the broadcast task filters by its allowed URLs
     user_key = str(user.id)
-    active_ws_connections.setdefault(user_key, set()).add(websocket)
+    register_ws(
+        user_key, websocket, None if allowed_urls is None else frozenset(allowed_urls)
+    )
     logging.info(f"✅ WS connected: {user.email}")
 
     try:
-        # We still don't care about incoming messages, but:
-        # - waiting on receive() lets shutdown cancel this task immediately
-        # - we handle disconnects cleanly
-        while True:
-            try:
-                msg = await websocket.receive()
-                if msg.get("type") == "websocket.disconnect":
-                    raise WebSocketDisconnect()
-            except WebSocketDisconnect:
-                raise
-            except asyncio.CancelledError:
-                logging.info(f"⚠️ WS receive cancelled for {user.email}")
-                raise
-            except Exception as e:
-                logging.error(f"WS receive error for {user.email}: {e}")
-                break
+        # Incoming messages are ignored. receive() is only here because it is
+        # what reports the disconnect (Starlette doesn't cancel the endpoint);
+        # clients don't send, so this wakes up about once per connection.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        logging.info(f"⚠️ WS disconnected: {user.email}")
 
     except (WebSocketDisconnect, asyncio.CancelledError):
         logging.info(f"⚠️ WS disconnected/cancelled: {user.email}")
+    except Exception as e:
+        logging.error(f"WS receive error for {user.email}: {e}")
     finally:
-        bucket = active_ws_connections.get(user_key)
-        if bucket:
-            bucket.discard(websocket)
-            if not bucket:
-                active_ws_connections.pop(user_key, None)
+        sender.cancel()
+        unregister_ws(user_key, websocket)
         logging.info(f"🔌 WS cleanup complete for {user.email}")
@@ -1,17 +1,23 @@
 from typing import Any, Dict, List
 import math
 
+import orjson
+from fastapi.responses import ORJSONResponse
 
-def safe_value(v: Any) -> Any:
-    if isinstance(v, float):
-        if math.isnan(v) or math.isinf(v):
-            return None
-    return v
+_isfinite = math.isfinite
 
 
 def dict_client_to_view(d: Dict[str, Any]) -> Dict[str, Any]:
     nodes = d.get("nodes") or {}
-    nodes_list = [{"name": k, "value": safe_value(v)} for k, v in nodes.items()]
+    # NaN / +-Inf aren't valid JSON -> null; one C-level check covers all
+    # three, inline since this runs for every node of every PLC on every tick
+    nodes_list = [
+        {
+            "name": k,
+            "value": None if isinstance(v, float) and not _isfinite(v) else v,
+        }
+        for k, v in nodes.items()
+    ]
 
     return {
         "name": d.get("name") or "",
@@ -23,3 +29,32 @@ def dict_client_to_view(d: Dict[str, Any]) -> Dict[str, Any]:
 
 def payload_from_raw_list(raw_list: List[Dict[str, Any]]) -> Dict[str, Any]:
     return {"plc_clients": [dict_client_to_view(d) for d in raw_list]}
+
+
+def _json_default(v: Any) -> Any:
+    # OPC UA values orjson has no native encoding for (LocalizedText, NodeId, bytes, ...)
+    return str(v)
+
+
+class TelemetryResponse(ORJSONResponse):
+    """ORJSONResponse that also encodes OPC UA value types (see _json_default)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_json_default)
+
+
+def dumps_client_view(d: Dict[str, Any]) -> bytes:
+    """Serialize one PLC's view; reused across every group that can see it."""
+    return orjson.dumps(dict_client_to_view(d), default=_json_default)
+
+
+def telemetry_frame(views: List[bytes]) -> str:
+    """
+    Assemble the WS text frame {"type": "telemetry_update", "data":
+    {"plc_clients": [...]}} by splicing pre-serialized client views.
+    """
+    return (
+        b'{"type":"telemetry_update","data":{"plc_clients":['
+        + b",".join(views)
+        + b"]}}"
+    ).decode()
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Hashable, Tuple
+
+
+# Bound for every TTL cache; past this the oldest entry is evicted
+CACHE_MAXSIZE = 10_000
+
+
+def cache_get(cache: Dict[Any, Tuple[float, Any]], key: Hashable) -> Any:
+    """Cached value for `key`, or None if missing/expired (expired entries are dropped)."""
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at <= time.monotonic():
+        cache.pop(key, None)
+        return None
+    return value
+
+
+def cache_put(cache: Dict[Any, Tuple[float, Any]], key: Hashable, value: Any, ttl: float) -> None:
+    """Store `value` for `ttl` seconds (no-op when ttl <= 0)."""
+    if ttl <= 0:
+        return
+    if key not in cache and len(cache) >= CACHE_MAXSIZE:
+        # dicts keep insertion order -> drop the oldest entry
+        cache.pop(next(iter(cache)), None)
+    cache[key] = (time.monotonic() + ttl, value)
@@ -17,6 +17,8 @@ from fastapi_users.manager import BaseUserManager
 from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app import acl_cache
+from app.auth_helpers import forget_user
 from db_async import get_async_session
 from models_user import User
 from schemas_user import UserRead, UserCreate, UserUpdate
@@ -132,6 +134,16 @@ class UserManager(BaseUserManager[User, uuid.UUID]):
     async def on_after_register(self, user: User, request=None):
         await send_welcome_email(user.email)
 
+    # WS auth caches the user row per token; don't let it outlive a change
+    # (deactivation, superuser flag) or a deletion.
+    async def on_after_update(self, user: User, update_dict, request=None):
+        forget_user(user.id)
+        acl_cache.bust(user.id)
+
+    async def on_after_delete(self, user: User, request=None):
+        forget_user(user.id)
+        acl_cache.bust(user.id)
+
 async def get_user_manager(
     user_db=Depends(get_user_db),
 ) -> AsyncGenerator[UserManager, None]:
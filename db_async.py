@@ -22,5 +22,12 @@ class Base(DeclarativeBase):
     pass
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    # One unit of work per request: commit what the handler left pending,
+    # roll back if it raised.
     async with SessionLocal() as session:
-        yield session
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import logging
 import asyncio
-import threading
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -17,8 +16,8 @@ from parks_routes import router as parks_router
 from app.config import CORS_ALLOW_ORIGINS
 from app.logging_config import configure_logging
 from app.broadcast import (
-    stop_event,
-    executor,
+    read_pool,
+    reconnect_pool,
     init_plc_clients,
     data_broadcast_loop,
     disconnect_all_clients,
@@ -70,10 +69,9 @@ app.include_router(parks_router)
 
 @app.on_event("startup")
 async def on_startup():
-    # Create PLC clients and start broadcast thread
+    # Create PLC clients and start the broadcast task
     init_plc_clients()
-    loop = asyncio.get_running_loop()
-    threading.Thread(target=data_broadcast_loop, args=(loop,), daemon=True).start()
+    app.state.broadcast_task = asyncio.create_task(data_broadcast_loop())
     logging.info("Startup complete.")
 
 
@@ -81,11 +79,38 @@ async def on_startup():
 async def on_shutdown():
     logging.info("Shutting down...")
 
-    # Stop broadcast loop + executor
-    stop_event.set()
-    executor.shutdown(wait=False, cancel_futures=True)
+    # Stop broadcast task + thread pools
+    task = getattr(app.state, "broadcast_task", None)
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    read_pool.shutdown(wait=False, cancel_futures=True)
+    reconnect_pool.shutdown(wait=False, cancel_futures=True)
 
     # Clean + fast-disconnect all PLC clients
     disconnect_all_clients()
 
     logging.info("Shutdown complete.")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Same as `uvicorn main:app --host 0.0.0.0 --port 8000`, with the fast
+    # implementations and WS keepalive spelled out: uvloop (falls back to asyncio where it
+    # isn't installed, e.g. Windows), httptools for HTTP parsing and the
+    # C-accelerated websockets library for /ws.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="httptools",
+        ws="websockets",
+        # protocol pings evict dead peers in ~10s instead of uvicorn's 20+20s
+        ws_ping_interval=5.0,
+        ws_ping_timeout=5.0,
+    )
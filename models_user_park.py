@@ -1,12 +1,14 @@
 # models_user_park.py
 from __future__ import annotations
 import uuid
-from sqlalchemy import String, ForeignKey
+from sqlalchemy import String, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from db_async import Base
 
 class UserParkAccess(Base):
     __tablename__ = "user_park_access"
+    # one row per (user, park): grants skip existing rows via ON CONFLICT DO NOTHING
+    __table_args__ = (UniqueConstraint("user_id", "park_id"),)
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
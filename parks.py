@@ -3,8 +3,10 @@ from __future__ import annotations
 
 import json
 import re
+import sys
 from pathlib import Path
-from typing import Dict, Set, Iterable, List
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Mapping, Set, Iterable, List
 
 # Optional: safe slug for fallback park_id if "id" missing
 _slug_re = re.compile(r"[^a-z0-9]+")
@@ -35,21 +37,46 @@ for item in _plc_config:
     if not url:
         # ignore incomplete entries silently (or raise if you prefer)
         continue
-    PARKS[park_id] = {"name": name or park_id, "url": url}
+    # interned: ids that are also interned elsewhere compare by identity
+    PARKS[sys.intern(park_id)] = {"name": name or park_id, "url": url}
 
-# Convenience set
-_KNOWN_PARKS: Set[str] = set(PARKS.keys())
+# Convenience set (membership only, so no need to touch the value dicts)
+_KNOWN_PARKS: FrozenSet[str] = frozenset(PARKS)
+
+# Every configured URL (what a superuser may see / write)
+ALL_PARK_URLS: FrozenSet[str] = frozenset(info["url"] for info in PARKS.values())
+
+# Flat park_id -> name / url lookups: one hash per field instead of two.
+# Read-only views; rebuild() refills the dicts underneath in place.
+_PARK_NAMES: Dict[str, str] = {pid: info["name"] for pid, info in PARKS.items()}
+_PARK_URLS: Dict[str, str] = {pid: info["url"] for pid, info in PARKS.items()}
+PARK_NAMES: Mapping[str, str] = MappingProxyType(_PARK_NAMES)
+PARK_URLS: Mapping[str, str] = MappingProxyType(_PARK_URLS)
+
+def rebuild() -> None:
+    """Recompute the derived lookups after PARKS has been modified."""
+    global _KNOWN_PARKS, ALL_PARK_URLS
+    _KNOWN_PARKS = frozenset(PARKS)
+    ALL_PARK_URLS = frozenset(info["url"] for info in PARKS.values())
+    _PARK_NAMES.clear()
+    _PARK_NAMES.update((pid, info["name"]) for pid, info in PARKS.items())
+    _PARK_URLS.clear()
+    _PARK_URLS.update((pid, info["url"]) for pid, info in PARKS.items())
+
+def all_park_urls() -> FrozenSet[str]:
+    """ALL_PARK_URLS, read at call time so callers see a rebuild()."""
+    return ALL_PARK_URLS
 
 def is_valid_park(park_id: str) -> bool:
-    return park_id in PARKS
+    return park_id in _KNOWN_PARKS
 
 def map_park_ids_to_urls(park_ids: Iterable[str]) -> Set[str]:
     """Return a set of OPC UA URLs for the provided park_ids (unknown ids ignored)."""
     urls: Set[str] = set()
     for pid in park_ids:
-        info = PARKS.get(pid)
-        if info and info.get("url"):
-            urls.add(info["url"])
+        url = _PARK_URLS.get(pid)
+        if url:
+            urls.add(url)
     return urls
 
 # ---- DB helpers to use when authorizing per-park access ----
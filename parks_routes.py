@@ -1,15 +1,22 @@
 # parks_routes.py — admin endpoints for park assignments
-from fastapi import APIRouter, Depends, HTTPException, status
+import hashlib
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from uuid import UUID
-from typing import List
+from typing import Dict, List, Optional
 
 from models_user import User
 from models_user_park import UserParkAccess
 from db_async import get_async_session
 from auth import current_superuser
-from parks import PARKS   # ← dict { park_id: {name, url} }
+from parks import PARKS, PARK_NAMES, PARK_URLS, is_valid_park, map_park_ids_to_urls   # ← dict { park_id: {name, url} }
+from app import acl_cache
+from app.broadcast import active_ws_connections, update_ws_access
 
 from pydantic import BaseModel
 
@@ -24,15 +31,72 @@ class ParkOut(BaseModel):
     url: str
 
 
+# PARKS only changes on a config reload, so the response items are built
+# (and validated) once instead of per request.
+_PARK_OUT_JSON_CACHE: Dict[str, dict] = {}
+# Full /admin/parks body + its ETag, so a request is a lookup
+_PARKS_JSON = b"[]"
+_PARKS_ETAG = ""
+
+
+def _rebuild_park_cache() -> None:
+    """Refill the park response caches from PARKS (call after parks.rebuild())."""
+    global _PARKS_JSON, _PARKS_ETAG
+    _PARK_OUT_JSON_CACHE.clear()
+    for pid in PARKS:
+        park = ParkOut(id=pid, name=PARK_NAMES[pid], url=PARK_URLS[pid])
+        _PARK_OUT_JSON_CACHE[pid] = park.model_dump()
+    _PARKS_JSON = orjson.dumps(list(_PARK_OUT_JSON_CACHE.values()))
+    _PARKS_ETAG = f'"{hashlib.sha256(_PARKS_JSON).hexdigest()[:32]}"'
+
+
+_rebuild_park_cache()
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check: "*" or any listed tag, compared weakly (RFC 9110)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _known_park_ids(park_ids: List[str]) -> List[str]:
+    """Dedupe `park_ids` (order kept); 404 if any isn't a configured park."""
+    unknown = [pid for pid in park_ids if not is_valid_park(pid)]
+    if unknown:
+        raise HTTPException(404, f"Unknown park id(s): {', '.join(unknown)}")
+    return list(dict.fromkeys(park_ids))
+
+
+async def _access_changed(session: AsyncSession, user_id: UUID) -> None:
+    """Drop the cached ACL and re-filter the user's open websockets."""
+    acl_cache.bust(user_id)
+
+    user_key = str(user_id)
+    if user_key not in active_ws_connections:
+        return
+    # freshly busted -> this re-reads and refills the cache
+    ids = await acl_cache.cached_park_ids(session, user_id)
+    urls = frozenset(map_park_ids_to_urls(ids))
+    update_ws_access(user_key, urls)
+
+
 # ------------------------
 # List all parks
 # ------------------------
 @router.get("/parks", response_model=List[ParkOut])
-async def list_parks(_: User = Depends(current_superuser)):
-    return [
-        ParkOut(id=pid, name=data["name"], url=data["url"])
-        for pid, data in PARKS.items()
-    ]
+async def list_parks(request: Request, _: User = Depends(current_superuser)):
+    # Pre-serialized body; returning a Response skips the response_model
+    # pass (the items were validated when the cache was built). The ETag
+    # lets the admin UI revalidate with a 304 instead of re-downloading.
+    headers = {"ETag": _PARKS_ETAG, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), _PARKS_ETAG):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=_PARKS_JSON, media_type="application/json", headers=headers)
 
 
 # ------------------------
@@ -44,17 +108,16 @@ async def get_user_parks(
     _: User = Depends(current_superuser),
     session: AsyncSession = Depends(get_async_session),
 ):
-    res = await session.execute(
-        select(UserParkAccess.park_id).where(UserParkAccess.user_id == user_id)
-    )
-    ids = [r[0] for r in res.all()]
+    # Panel re-renders hit memory; grant/revoke bust the entry
+    ids = await acl_cache.cached_park_ids(session, user_id)
+    # Done with the DB (auth's user lookup ran on this session too): hand
+    # the connection back before the response is built and sent.
+    await session.close()
 
     # only return parks that still exist in config.json
-    return [
-        ParkOut(id=pid, name=PARKS[pid]["name"], url=PARKS[pid]["url"])
-        for pid in ids
-        if pid in PARKS
-    ]
+    return ORJSONResponse(
+        [_PARK_OUT_JSON_CACHE[pid] for pid in ids if pid in _PARK_OUT_JSON_CACHE]
+    )
 
 
 # ------------------------
@@ -62,7 +125,8 @@ async def get_user_parks(
 # ------------------------
 @router.post(
     "/users/{user_id}/parks/{park_id}",
-    status_code=status.HTTP_204_NO_CONTENT
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response,
 )
 async def grant_user_park(
     user_id: UUID,
@@ -70,18 +134,81 @@ async def grant_user_park(
     _: User = Depends(current_superuser),
     session: AsyncSession = Depends(get_async_session),
 ):
-    if park_id not in PARKS:
-        raise HTTPException(404, f"Unknown park id: {park_id}")
+    await _grant(session, user_id, _known_park_ids([park_id]))
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-    exists = await session.execute(
-        select(UserParkAccess).where(
-            UserParkAccess.user_id == user_id,
-            UserParkAccess.park_id == park_id
-        )
+
+# ------------------------
+# Grant several parks at once
+# ------------------------
+@router.post(
+    "/users/{user_id}/parks",
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response,
+)
+async def grant_user_parks(
+    user_id: UUID,
+    park_ids: List[str],
+    _: User = Depends(current_superuser),
+    session: AsyncSession = Depends(get_async_session),
+):
+    park_ids = _known_park_ids(park_ids)
+    if park_ids:
+        await _grant(session, user_id, park_ids)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+# ------------------------
+# Replace a user's parks with the given set
+# ------------------------
+@router.put(
+    "/users/{user_id}/parks",
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response,
+)
+async def set_user_parks(
+    user_id: UUID,
+    park_ids: List[str],
+    _: User = Depends(current_superuser),
+    session: AsyncSession = Depends(get_async_session),
+):
+    desired = _known_park_ids(park_ids)
+
+    # Adds + removes in one transaction / one commit
+    changed = await _insert_access(session, user_id, desired) if desired else 0
+    stmt = delete(UserParkAccess).where(UserParkAccess.user_id == user_id)
+    if desired:
+        stmt = stmt.where(UserParkAccess.park_id.not_in(desired))
+    changed += (await session.execute(stmt)).rowcount
+
+    if not changed:
+        await session.rollback()
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    await session.commit()
+    await _access_changed(session, user_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+async def _insert_access(session: AsyncSession, user_id: UUID, park_ids: List[str]) -> int:
+    # One INSERT; rows the user already has are skipped by the DB. No
+    # conflict target: that would fail outright on databases still missing
+    # the (user_id, park_id) unique constraint (see README).
+    stmt = (
+        pg_insert(UserParkAccess)
+        .values([{"user_id": user_id, "park_id": pid} for pid in park_ids])
+        .on_conflict_do_nothing()
     )
-    if exists.scalar_one_or_none() is None:
-        session.add(UserParkAccess(user_id=user_id, park_id=park_id))
-        await session.commit()
+    return (await session.execute(stmt)).rowcount
+
+
+async def _grant(session: AsyncSession, user_id: UUID, park_ids: List[str]) -> None:
+    inserted = await _insert_access(session, user_id, park_ids)
+    # Commit here rather than in get_async_session: the caches must only be
+    # busted once the change is visible, or they could re-read the old rows.
+    await session.commit()
+    if inserted:
+        await _access_changed(session, user_id)
 
 
 # ------------------------
@@ -89,7 +216,8 @@ async def grant_user_park(
 # ------------------------
 @router.delete(
     "/users/{user_id}/parks/{park_id}",
-    status_code=status.HTTP_204_NO_CONTENT
+    status_code=status.HTTP_204_NO_CONTENT,
+    response_class=Response,
 )
 async def revoke_user_park(
     user_id: UUID,
@@ -97,10 +225,17 @@ async def revoke_user_park(
     _: User = Depends(current_superuser),
     session: AsyncSession = Depends(get_async_session),
 ):
-    await session.execute(
+    res = await session.execute(
         delete(UserParkAccess).where(
             UserParkAccess.user_id == user_id,
             UserParkAccess.park_id == park_id
-        )
+        ).returning(UserParkAccess.park_id)
     )
+    # Nothing matched -> nothing to commit or invalidate
+    if res.first() is None:
+        await session.rollback()
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
     await session.commit()
+    await _access_changed(session, user_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)